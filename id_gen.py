@@ -13,16 +13,19 @@ Outline:
 ========
 
 1. Load modules
-2. Configurate the commandline interface
-3. Process the commandline arguments into variables
-4. Initiate debug mode, if enabled
-5. Check the validity of the arguments/paths
-6. Open the templates
-7. Open the data file and process it
+2. Define the per-student worker
     1. Get the student information
     2. Fill the information into the template
     3. Render the SVG templates into PDFs
     4. Merge the front and back PDFs into one
+3. Configurate the commandline interface
+4. Process the commandline arguments into variables
+5. Initiate debug mode, if enabled
+6. Check the validity of the arguments/paths
+7. Open the templates
+8. Index the student photos
+9. Open the data file and collect the students
+10. Generate the IDs in parallel, one batch of students per worker task
 """
 
 #### Load modules
@@ -31,228 +34,561 @@ import argparse                     # Commandline argument processor
 import barcode                      # To generate the barcodes
 import base64                       # To embed the images in the SVG
 import cairosvg                     # To conver the svg to a pdf
+import concurrent.futures           # Write the PDFs in the background
+import copy                         # Copy the parsed templates
 import csv                          # Parse the data file (which is a CSV file)
+import hashlib                      # Skip the IDs whose inputs are unchanged
+import io                           # Keep the rendered PDFs in memory
+import logging                      # Output the debug information
+import multiprocessing              # Generate the IDs on every CPU core
 import os                           # Create and manage/manipulate paths
-from PyPDF2 import PdfFileMerger    # Merge the front and back of the IDs
-
-#### Configurate the commandline interface
-
-# Initiate the parser with a description of this tool
-parser = argparse.ArgumentParser(description='Bulk generates student IDs from \
-    a template, csv data file, and images')
-# Add the `--template` argument as required
-parser.add_argument('--template', required=True, help='The path to the        \
-    template SVG directory')
-# Add the `--data` argument as required
-parser.add_argument('--data', required=True, help='The path to the CSV data   \
-    file')
-# Add the `--images` argument as required
-parser.add_argument('--images', required=True, help='The path to the          \
-    directory of student photo images')
-# Add the `--out` argument as optional
-parser.add_argument('--out', default='./id_gen_out', help='The path to the    \
-    desired output directory. Defaults to \'./id_gen_out\'. Note: will fail   \
-    if the directory (or the tmp subdirectory) does not already exist.')
-# Add the `--debug` argument as optional; (if included: True; otherwise: False)
-parser.add_argument('--debug', action='store_true', help='Enable debug output')
-
-#### Process the commandline arguments into variables
-
-# Parse the arguments into `args`
-args = parser.parse_args()
-# The path to the template SVG to load
-template_path = args.template
-# The path to the data file to load and parse
-data_path = args.data
-# The path to the images directory to find the needed photos
-images_path = args.images
-# The path to the output PDFs
-output_path = args.out
-# Whether to output debug information to stdout
-debug = args.debug
-
-#### Initiate debug mode, if enabled
-
-if debug:
-    # Let the user know debug mode is enabled
-    print("Debug mode enabled")
-    # Output argument values as stored
-    print(f"template_path: {template_path}")
-    print(f"data_path: {data_path}")
-    print(f"images_path: {images_path}")
-    print(f"debug: {str(debug)}") # debug is a bool, not a str
-
-#### Check the validity of the arguments/paths
-
-# If the `template_path`s does not exist, exit with an error
-if (not os.path.exists(os.path.join(template_path, 'front.svg'))
-    or not os.path.exists(os.path.join(template_path, 'back.svg'))):
-    exit(f"Error: {os.path.join(template_path, 'front.svg')} or "             \
-        f"{os.path.join(template_path, 'back.svg')} does not exist")
-
-# If the `data_path` does not exist, exit with an error
-if not os.path.exists(data_path):
-    exit(f"Error: {data_path} does not exist")
-
-# If the `images_path` does not exist, exit with an error
-if not os.path.exists(images_path):
-    exit(f"Error: {images_path} does not exist")
-
-# If the `output_path` directory or `output_path`/tmp does *not* exist
-if not os.path.exists(os.path.join(output_path, 'tmp')):
-    if debug: print(f"{output_path} or {os.path.join(output_path, 'tmp')}"    \
-        "does not exist. Creating it...")
-    # Create the tmp subdirectory and any other necessary parent directories
-    os.makedirs(os.path.join(output_path, 'tmp'))
-
-#### Open the templates
-
-# Read the contents of the front template at `template_path` into
-# `template_front`
-with open(template_path + "front.svg") as f:
-    template_front = f.read()
-
-# Read the contents of the back template at `template_path` into
-# `template_back`
-with open(template_path + "back.svg") as f:
-    template_back = f.read()
-
-if debug:
-    print("`template_front` contents:")
-    print(template_front)
-    print("`template_back` contents:")
-    print(template_back)
-
-#### Open the data file and process it
-
-with open(data_path) as datafile:
-    data = csv.reader(datafile)
-    for row in data:
-        #### Get the student information
-
-        # row[0]: first
-        # row[1]: last
-        # row[2]: year
-        # row[3]: id
-        # row[4]: photo
-
-        # In debug mode, output the row separated with commas
-        if debug: print(', '.join(row))
-
-        # If the row is a header row, continue to the next row
-        if row == ['First', 'Last', 'Year', 'ID Number', 'Photo Number']:
-            continue
-        # If the photo cell is empty, continue to the next row.
-        # This would happen if the student isn't real (e.g. Fake Student) or
-        # they weren't there on picture day.
-        if row[4] == '':
-            print(f"Student {row[0]} {row[1]} does not have a photo. "        \
-            "Skipping...")
-            continue
-
-        # Read the contents of the image at `images_path`/<year>/<photo>.jpg
-        # and convert it into a base64 string
-        with open(os.path.join(images_path, row[2], row[4] + '.jpg'), 'rb')   \
-            as f:
-            # NOTE: If the student is off scale for the box, make sure the svg
-            # element for the element is using the width and height of the
-            # box/outline, and not the width and height of the image and a
-            # scale!
-
-            # The [2:-1] 'removes' the first two characters (b') and the last
-            # character (') of the string
-            image_str = str(base64.b64encode(f.read()))[2:-1]
-
-        # Create the barcode object:
-        #     `barcode.get_barcode_class('code128')(row[3])`
-        # Render (to an svg string) the barcode object with a `module_width` of
-        # 1 and disabled text:
-        #     .render(writer_options={'module_width': 1, 'write_text': False})
-        # Remove the b' from the beginning and the ' from the end:
-        #     [2:-1]
-        # Encode the rendered string in base64:
-        #     base64.b64encode(...)
-        # Convert the encoded base64 to a str:
-        #     str(...)
-        # Remove the (new) b' from the beginning and the ' from the end:
-        #     [2:-1]
-        id_barcode = str(base64.b64encode(
-                cairosvg.svg2png(
-                    bytestring=barcode.get_barcode_class('code128')(row[3])
-                        .render(
-                            writer_options={
-                                'module_width': 1,
-                                'write_text': False
-                            }
-                        ),
-                    scale=10
+import pikepdf                      # Merge the front and back of the IDs
+import re                           # Find template strings and barcode bars
+import sys                          # Output the debug information to stdout
+
+#### Define the per-student worker
+
+# The logger of the debug information. Its level is set once (in the main
+# process and in every worker), so with debug mode off the debug messages
+# are dropped without ever being formatted.
+log = logging.getLogger(__name__)
+
+# The state shared by every student. These are filled in once per worker
+# process by `init_worker` so the (large) templates are not pickled and sent
+# along with every single row.
+template_front = None
+template_back = None
+photo_index = None
+output_path = None
+# The buffer the photos are read into, reused from student to student so
+# every photo does not need a fresh (multi-megabyte) allocation. It is grown
+# whenever a photo does not fit.
+photo_buffer = None
+# The hash of the render version and both templates, copied and extended with
+# each student's row and photo to get the key of their ID
+template_hash = None
+
+
+# The template strings in the templates, e.g. <!-- NAME -->
+PLACEHOLDER_RE = re.compile(rb'<!-- (NAME|YEAR|ID|PHOTO|BARCODE) -->')
+# What the template strings are swapped for before the templates are parsed:
+# the name between two private use characters, which (unlike the comments)
+# are valid in attributes and never show up in the SVGs otherwise.
+# <!-- NAME --> becomes \ue000NAME\ue000.
+PLACEHOLDER_MARK = '\ue000'
+# The xml:space attribute, which keeps the white space of a text as is when
+# set to "preserve"
+XML_SPACE = '{http://www.w3.org/XML/1998/namespace}space'
+
+# The Code 128 barcode class, looked up once instead of for every student
+Code128 = barcode.get_barcode_class('code128')
+# A run of black modules (bars) in a built barcode, e.g. 11 in 0110
+BARS_RE = re.compile(r'1+')
+# The barcode geometry, in modules (each one 1 wide), matching what
+# python-barcode renders for Code 128 with a `module_width` of 1: the quiet
+# zone left and right of the bars, the margin above and below them and
+# their height
+BARCODE_QUIET_ZONE = 2.54
+BARCODE_MARGIN = 1
+BARCODE_HEIGHT = 15
+
+# The number of students handed to a worker at a time. Each batch renders
+# its fronts and then its backs, so larger batches switch templates less,
+# while smaller ones spread the students more evenly across the workers.
+BATCH_SIZE = 8
+
+# The version of how the IDs are drawn, which is part of every ID's key.
+# Bump it whenever a change to the code (the barcode, `render_pdf`,
+# `merge_pdfs`, etc.) can change the output PDFs, so re-runs regenerate the
+# IDs made before the change instead of keeping them.
+RENDER_VERSION = 1
+
+
+def render_barcode_b64(id_str):
+    """Render the barcode of `id_str` into a base64 encoded SVG string."""
+    # Build the barcode of the id into its modules, e.g. '11010010000...',
+    # where every 1 is a black module and every 0 a white one
+    modules = Code128(id_str).build()[0]
+
+    # The size of the whole barcode
+    width = 2 * BARCODE_QUIET_ZONE + len(modules)
+    height = 2 * BARCODE_MARGIN + BARCODE_HEIGHT
+
+    # Draw the barcode straight into a (small) svg: a white background and a
+    # black rectangle for every bar. This skips python-barcode's own svg
+    # writer, which builds a whole XML document for the same rectangles.
+    svg = (
+        f'<svg xmlns="http://www.w3.org/2000/svg" '
+        f'viewBox="0 0 {width:g} {height:g}" '
+        f'width="{width:g}" height="{height:g}">'
+        f'<rect width="100%" height="100%" fill="white"/>'
+    ) + ''.join(
+        f'<rect x="{BARCODE_QUIET_ZONE + bar.start():g}" '
+        f'y="{BARCODE_MARGIN}" width="{len(bar.group())}" '
+        f'height="{BARCODE_HEIGHT}" fill="black"/>'
+        for bar in BARS_RE.finditer(modules)
+    ) + '</svg>'
+
+    # Encode the svg in base64 and decode the encoded base64 (which is plain
+    # ASCII) into a str. The svg is embedded as is, so Cairo draws the bars
+    # as vectors while rendering the PDF instead of rasterizing a PNG first.
+    return base64.b64encode(svg.encode('ascii')).decode('ascii')
+
+
+def prepare_template(template):
+    """Parse the SVG `template` bytes once into a reusable CairoSVG tree.
+
+    Returns the parsed tree and a list of the fields to fill in for every
+    student: (node, attribute or None for the text, parts), where `parts`
+    alternates between literal text and template string names.
+    """
+    # Swap the template strings for the marked names and parse the result
+    mark = PLACEHOLDER_MARK.encode('utf-8')
+    tree = cairosvg.parser.Tree(
+        bytestring=PLACEHOLDER_RE.sub(mark + rb'\1' + mark, template)
+    )
+
+    # Walk the tree and note every attribute and text with a marked name
+    fields = []
+    nodes = [tree]
+    while nodes:
+        node = nodes.pop()
+        nodes.extend(node.children)
+        for attribute, value in node.items():
+            if isinstance(value, str) and PLACEHOLDER_MARK in value:
+                fields.append(
+                    (node, attribute, value.split(PLACEHOLDER_MARK))
                 )
-            ))[2:-1]
-
-        if debug:
-            print("Barcode of id " + row[3] + ":")
-            print(id_barcode)
-
-        #### Fill the information into the template
-
-        # Replace all of the template strings in the front:
-        # <!-- NAME -->     becomes     row[0] + ' ' + row[1]
-        # <!-- YEAR -->     becomes     row[2]
-        # <!-- ID -->       becomes     row[3]
-        # <!-- PHOTO -->    becoems     image_str
-        id_front = template_front                                             \
-            .replace('<!-- NAME -->', row[0] + ' ' + row[1])                  \
-            .replace('<!-- YEAR -->', row[2]).replace('<!-- ID -->', row[3])  \
-            .replace('<!-- PHOTO -->', image_str)
-
-        # Replace all of the template strings in the back:
-        # <!-- BARCODE -->     becomes     id_barcode
-        id_back = template_back                                               \
-            .replace('<!-- BARCODE -->', id_barcode)
-
-        if debug:
-            print("ID Front:")
-            print(id_front)
-            print("ID Back:")
-            print(id_back)
-
-        #### Render the SVG templates into PDFs
-
-        # Pass the svg string as a bytestring encoded in UTF-8 to CairoSVG and
-        # write the output pdf to
-        # output_path + '/' + row[3] + '-<front or back>.pdf'
-        #
-        # The width/height numbers involved some trial and error but these are
-        # the size needed to output the correct PDF size for the IDs.
-        cairosvg.svg2pdf(
-            bytestring=id_front.encode('utf-8'),
-            write_to=os.path.join(output_path, 'tmp', row[3] + '-front.pdf'),
-            parent_width=323,
-            parent_height=204
-        )
-        cairosvg.svg2pdf(
-            bytestring=id_back.encode('utf-8'),
-            write_to=os.path.join(output_path, 'tmp', row[3] + '-back.pdf'),
-            parent_width=323,
-            parent_height=204
+        if node.text and PLACEHOLDER_MARK in node.text:
+            fields.append((node, None, node.text.split(PLACEHOLDER_MARK)))
+
+    return tree, fields
+
+
+def render_pdf(template, values):
+    """Render a copy of the prepared `template` filled in with `values`.
+
+    `values` maps the template string names to their text. Returns an
+    in-memory buffer holding the rendered PDF.
+    """
+    tree, fields = template
+
+    # Copy the parsed tree (which is much cheaper than parsing the SVG
+    # again), as CairoSVG stores some of its own state on the nodes while
+    # drawing. `memo` maps the id of every original node to its copy.
+    memo = {}
+    tree = copy.deepcopy(tree, memo)
+
+    # Fill in the fields of the copy. The odd parts are the template string
+    # names, the even parts the literal text around them.
+    for node, attribute, parts in fields:
+        node = memo[id(node)]
+        value = ''.join(
+            values[part] if i % 2 else part for i, part in enumerate(parts)
         )
+        if attribute is None:
+            # Normalize the white space like CairoSVG does when it parses
+            # the text itself, keeping it as is for xml:space="preserve"
+            preserve = node.get(XML_SPACE) == 'preserve'
+            node.text = cairosvg.parser.handle_white_spaces(value, preserve)
+            if not preserve:
+                node.text = node.text.strip(' ')
+        else:
+            node[attribute] = value
+
+    # Render the filled in tree into a PDF in an in-memory buffer, so the
+    # front and back never have to be written to (and read back from) the
+    # disk.
+    #
+    # The width/height numbers involved some trial and error but these are
+    # the size needed to output the correct PDF size for the IDs.
+    output = io.BytesIO()
+    cairosvg.surface.PDFSurface(
+        tree,
+        output,
+        96,
+        parent_width=323,
+        parent_height=204
+    ).finish()
+    return output
+
+
+def init_worker(front, back, photos, output, log_level):
+    """Store the shared state in the worker process's globals."""
+    global template_front, template_back, photo_index, output_path
+    global photo_buffer, template_hash
+    # Output the debug information like the main process does (a worker that
+    # was spawned rather than forked does not inherit its logging setup)
+    logging.basicConfig(level=log_level, format='%(message)s',
+        stream=sys.stdout)
+    # Parse the templates once per worker, not once per student
+    template_front = prepare_template(front)
+    template_back = prepare_template(back)
+    photo_index = photos
+    # End the output path with exactly one separator, so the path of every
+    # PDF is a plain f-string instead of an `os.path.join` per student
+    output_path = os.path.join(output, '')
+    photo_buffer = bytearray(4 * 1024 * 1024)
+    template_hash = hashlib.blake2b(f'{RENDER_VERSION}\n'.encode('ascii'))
+    template_hash.update(front)
+    template_hash.update(back)
+
+
+def prepare_student(row):
+    """Gather what is needed to render the ID of the student in `row`.
+
+    Returns the path the PDF belongs at, the key of its inputs and the
+    values of the template strings, or None if the PDF already there was
+    made from the same inputs.
+    """
+    global photo_buffer
+
+    # row[0]: first
+    # row[1]: last
+    # row[2]: year
+    # row[3]: id
+    # row[4]: photo
+
+    # Read the contents of the image at `images_path`/<year>/<photo>.jpg
+    # (looked up in the `photo_index`) and encode it in base64
+    with open(photo_index[(row[2], row[4])], 'rb') as f:
+        # NOTE: If the student is off scale for the box, make sure the svg
+        # element for the element is using the width and height of the
+        # box/outline, and not the width and height of the image and a
+        # scale!
+
+        # Grow the reused buffer if the photo does not fit in it
+        size = os.fstat(f.fileno()).st_size
+        if size > len(photo_buffer):
+            photo_buffer = bytearray(size)
+        # Read the photo into the start of the buffer
+        size = f.readinto(memoryview(photo_buffer)[:size])
+
+    # The path of the output PDF: output_path + '/' + row[3] + '.pdf'
+    path = f'{output_path}{row[3]}.pdf'
+
+    # The key of everything the ID is made from: the render version, the
+    # templates, the row and the photo
+    key = template_hash.copy()
+    key.update(repr(row).encode('utf-8'))
+    key.update(memoryview(photo_buffer)[:size])
+    key = key.hexdigest()
+
+    # If the ID was already made from the exact same inputs (its key is in
+    # the .hash file next to it), there is nothing to do
+    try:
+        with open(path + '.hash') as f:
+            if f.read() == key and os.path.exists(path):
+                log.debug("%s is up to date. Skipping...", path)
+                return None
+    except FileNotFoundError:
+        pass
+
+    # Encode the photo in base64 and decode the encoded base64 (which is plain
+    # ASCII) into a str
+    image_b64 = base64.b64encode(memoryview(photo_buffer)[:size])            \
+        .decode('ascii')
+
+    # Render the barcode of the student's id into a base64 encoded SVG
+    id_barcode = render_barcode_b64(row[3])
+
+    log.debug("Barcode of id %s:\n%s", row[3], id_barcode)
+
+    #### Fill the information into the templates
+
+    # Replace all of the template strings:
+    # <!-- NAME -->     becomes     row[0] + ' ' + row[1]
+    # <!-- YEAR -->     becomes     row[2]
+    # <!-- ID -->       becomes     row[3]
+    # <!-- PHOTO -->    becoems     image_b64
+    # <!-- BARCODE -->  becomes     id_barcode
+    values = {
+        'NAME': f'{row[0]} {row[1]}',
+        'YEAR': row[2],
+        'ID': row[3],
+        'PHOTO': image_b64,
+        'BARCODE': id_barcode
+    }
+
+    log.debug("ID Front and Back values:\nNAME: %s, YEAR: %s, ID: %s",
+        values['NAME'], values['YEAR'], values['ID'])
+
+    return path, key, values
+
+
+def merge_pdfs(front, back, path):
+    """Merge the `front` and `back` PDF buffers into one PDF at `path`."""
+    # Open the rendered front and back with pikepdf (QPDF)
+    with pikepdf.open(front) as front_pdf, pikepdf.open(back) as back_pdf:
+        # Add the back to the end of the front, so the already open front is
+        # the output PDF and no new PDF has to be set up for every student
+        front_pdf.pages.extend(back_pdf.pages)
+        # Write the output PDF straight to its file
+        front_pdf.save(path)
+
+
+def write_id(path, key, front, back):
+    """Merge the `front` and `back` into the ID PDF at `path`, keyed `key`."""
+    # Forget what the old PDF was made from before overwriting it, so a run
+    # cut off partway through cannot leave a key behind that still matches
+    # the old inputs
+    try:
+        os.remove(path + '.hash')
+    except FileNotFoundError:
+        pass
+    merge_pdfs(front, back, path)
+    # Only once the PDF is written, record what it was made from
+    with open(path + '.hash', 'w') as output:
+        output.write(key)
+
+
+def process_batch(rows):
+    """Generate the merged front/back ID PDFs for the students in `rows`.
+
+    Returns the number of IDs generated and the number skipped as already
+    up to date.
+    """
+    #### Get the student information
+
+    students = [
+        student for student in map(prepare_student, rows)
+        if student is not None
+    ]
+
+    #### Render the SVG templates into PDFs
+
+    # Render all of the fronts first and then all of the backs, rather than
+    # alternating between the two, so Cairo keeps working on the same
+    # template (and its fonts, images, etc.) for a whole run. The backs are
+    # rendered below, one at a time as their IDs are handed off to be written.
+    fronts = [render_pdf(template_front, values) for _, _, values in students]
+
+    #### Merge the front and back PDFs into one
+
+    # Each finished ID is merged and written by a background thread, so the
+    # worker's core renders the next back instead of waiting on the disk.
+    # The PDFs never leave the worker, and leaving the `with` waits for every
+    # write, so they are all on the disk before the batch is handed back.
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as writer:
+        writes = [
+            writer.submit(write_id, path, key, front,
+                render_pdf(template_back, values))
+            for (path, key, values), front in zip(students, fronts)
+        ]
+    # Raise the error of any write that failed
+    for write in writes:
+        write.result()
+
+    return len(students), len(rows) - len(students)
+
+
+def main():
+    """Parse the commandline and generate an ID for every student."""
+    #### Configurate the commandline interface
+
+    # Initiate the parser with a description of this tool
+    parser = argparse.ArgumentParser(description='Bulk generates student IDs  \
+        from a template, csv data file, and images')
+    # Add the `--template` argument as required
+    parser.add_argument('--template', required=True, help='The path to the    \
+        template SVG directory')
+    # Add the `--data` argument as required
+    parser.add_argument('--data', required=True, help='The path to the CSV    \
+        data file')
+    # Add the `--images` argument as required
+    parser.add_argument('--images', required=True, help='The path to the      \
+        directory of student photo images')
+    # Add the `--out` argument as optional
+    parser.add_argument('--out', default='./id_gen_out', help='The path to    \
+        the desired output directory. Defaults to \'./id_gen_out\'. It is    \
+        created if it does not already exist.')
+    # Add the `--debug` argument as optional; (if included: True; otherwise:
+    # False)
+    parser.add_argument('--debug', action='store_true', help='Enable debug    \
+        output')
+
+    #### Process the commandline arguments into variables
+
+    # Parse the arguments into `args`
+    args = parser.parse_args()
+    # The path to the template SVG to load
+    template_path = args.template
+    # The paths of the front and back templates in `template_path`
+    template_front_path = os.path.join(template_path, 'front.svg')
+    template_back_path = os.path.join(template_path, 'back.svg')
+    # The path to the data file to load and parse
+    data_path = args.data
+    # The path to the images directory to find the needed photos
+    images_path = args.images
+    # The path to the output PDFs
+    output_path = args.out
+    # Whether to output debug information to stdout
+    debug = args.debug
+
+    #### Initiate debug mode, if enabled
+
+    # Output the debug messages (plainly, to stdout) only in debug mode
+    log_level = logging.DEBUG if debug else logging.WARNING
+    logging.basicConfig(level=log_level, format='%(message)s',
+        stream=sys.stdout)
 
-        #### Merge the front and back PDFs into one
-
-        # Initialize the PDF merger
-        merger = PdfFileMerger()
-        # The path to the front of the id
-        front = os.path.join(output_path, 'tmp', row[3] + '-front.pdf')
-        # The path to the back of the id
-        back = os.path.join(output_path, 'tmp', row[3] + '-back.pdf')
-        # Add the front to the output PDF
-        merger.append(front)
-        # Add the back to the output PDF
-        merger.append(back)
-        # Open/create the output PDF file in write byte mode
-        with open(os.path.join(output_path, row[3] + '.pdf'), 'wb') as output:
-            # Write the output to the output PDF
-            merger.write(output)
-
-# Just to be nice, let's say we are done, with a newline just to be clear.
-print("\nDone.")
+    # Let the user know debug mode is enabled
+    log.debug("Debug mode enabled")
+    # Output argument values as stored
+    log.debug("template_path: %s", template_path)
+    log.debug("data_path: %s", data_path)
+    log.debug("images_path: %s", images_path)
+    log.debug("debug: %s", debug)
+
+    #### Check the validity of the arguments/paths
+
+    # If the `template_path`s does not exist, exit with an error
+    if (not os.path.exists(template_front_path)
+        or not os.path.exists(template_back_path)):
+        exit(f"Error: {template_front_path} or {template_back_path} does not "\
+            "exist")
+
+    # If the `data_path` does not exist, exit with an error
+    if not os.path.exists(data_path):
+        exit(f"Error: {data_path} does not exist")
+
+    # If the `images_path` does not exist, exit with an error
+    if not os.path.exists(images_path):
+        exit(f"Error: {images_path} does not exist")
+
+    # If the `output_path` directory does *not* exist
+    if not os.path.exists(output_path):
+        log.debug("%s does not exist. Creating it...", output_path)
+        # Create the output directory and any other necessary parent
+        # directories
+        os.makedirs(output_path)
+
+    #### Open the templates
+
+    # Read the contents of the front template at `template_front_path` into
+    # `template_front`. The templates are several hundred KB (mostly the
+    # embedded logo), so read them through a 64 KB buffer. They are kept as
+    # (UTF-8) bytes, which is what CairoSVG gets in the end anyway.
+    with open(template_front_path, 'rb', buffering=1 << 16) as f:
+        template_front = f.read()
+
+    # Read the contents of the back template at `template_back_path` into
+    # `template_back`
+    with open(template_back_path, 'rb', buffering=1 << 16) as f:
+        template_back = f.read()
+
+    # (Decoding the templates is not free, so only do it in debug mode)
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("`template_front` contents:\n%s",
+            template_front.decode('utf-8'))
+        log.debug("`template_back` contents:\n%s",
+            template_back.decode('utf-8'))
+
+    #### Index the student photos
+
+    # Map (<year>, <photo>) to the path of `images_path`/<year>/<photo>.jpg
+    # for every photo, listing each year directory once instead of building
+    # and looking up a path for every student. The extension is matched
+    # whatever its case, e.g. <photo>.JPG from some cameras.
+    photo_index = {}
+    for year_entry in os.scandir(images_path):
+        if not year_entry.is_dir():
+            continue
+        for photo_entry in os.scandir(year_entry.path):
+            photo, extension = os.path.splitext(photo_entry.name)
+            if extension.lower() == '.jpg':
+                photo_index[(year_entry.name, photo)] = photo_entry.path
+
+    log.debug("Found %d photos in %s", len(photo_index), images_path)
+
+    #### Open the data file and collect the students
+
+    # The rows of the students that will get an ID, by ID number
+    rows = {}
+
+    # `newline=''` is the mode the csv module expects (it handles the line
+    # endings itself) and the large buffer cuts down on read syscalls for
+    # long rosters
+    with open(data_path, newline='', buffering=1 << 20) as datafile:
+        data = csv.reader(datafile)
+
+        # Consume the header row before the loop, so the students do not
+        # each have to be compared against it. If it is not the expected
+        # header, exit with an error.
+        header = next(data, None)
+        log.debug("%s", header)
+        if header != ['First', 'Last', 'Year', 'ID Number', 'Photo Number']:
+            exit(f"Error: {data_path} does not start with the header row "    \
+                "First,Last,Year,ID Number,Photo Number")
+
+        for row in data:
+            # In debug mode, output the row
+            log.debug("%s", row)
+
+            # If the photo cell is empty, continue to the next row.
+            # This would happen if the student isn't real (e.g. Fake Student)
+            # or they weren't there on picture day.
+            if row[4] == '':
+                print(f"Student {row[0]} {row[1]} does not have a photo. "    \
+                "Skipping...")
+                continue
+            # If the photo is not in the index, it may still be found under
+            # another case on a case-insensitive filesystem (macOS, Windows),
+            # e.g. p3.jpg for a cell of P3, so check its path directly
+            photo_path = os.path.join(images_path, row[2], row[4] + '.jpg')
+            if ((row[2], row[4]) not in photo_index
+                and os.path.isfile(photo_path)):
+                photo_index[(row[2], row[4])] = photo_path
+            # If the photo is not in the images directory, continue to the
+            # next row instead of failing partway through the run
+            if (row[2], row[4]) not in photo_index:
+                print(f"Student {row[0]} {row[1]}'s photo "                   \
+                f"{photo_path} does not exist. Skipping...")
+                continue
+
+            # If the ID number was already used by an earlier row, warn about
+            # it and keep the later row, the way its PDF would have
+            # overwritten the earlier one
+            if row[3] in rows:
+                print(f"Student {row[0]} {row[1]}'s ID number {row[3]} is "   \
+                "already used by an earlier row. Replacing it...")
+            rows[row[3]] = row
+
+    rows = list(rows.values())
+
+    #### Generate the IDs in parallel, one batch of students per worker task
+
+    # Every student is independent of the others, so spread them across one
+    # worker process per CPU core, in batches of BATCH_SIZE students. The
+    # templates, photo index and output path are handed to each worker once
+    # through `init_worker` rather than with every batch.
+    with multiprocessing.Pool(
+        os.cpu_count(),
+        initializer=init_worker,
+        initargs=(template_front, template_back, photo_index, output_path,
+            log_level)
+    ) as pool:
+        # Drain the results; the order the IDs finish in does not matter. Each
+        # worker writes its PDFs before handing back its batch, so they are
+        # all on the disk by the time the pool is shut down.
+        batches = [rows[i:i + BATCH_SIZE]
+            for i in range(0, len(rows), BATCH_SIZE)]
+        # The number of IDs generated and skipped as up to date
+        generated = skipped = 0
+        for batch_generated, batch_skipped in pool.imap_unordered(
+            process_batch, batches
+        ):
+            generated += batch_generated
+            skipped += batch_skipped
+
+    # Let the user know how many IDs were (re)generated, and how many were
+    # already up to date from an earlier run
+    print(f"Generated {generated} IDs, skipped {skipped} that were already " \
+        "up to date.")
+
+    # Just to be nice, let's say we are done, with a newline just to be clear.
+    print("\nDone.")
+
+
+if __name__ == '__main__':
+    main()